@@ -1,20 +1,254 @@
 # app.py
 
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+import google.generativeai as genai
+from google.generativeai.types import generation_types
+from google.api_core import exceptions as google_exceptions
+from google.api_core import retry as google_retry
+from google.auth import exceptions as google_auth_exceptions
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
+import orjson # Faster JSON parsing and serialization than the stdlib json module
+import os
 import re # For cleaning recipe text
+import sys
+import time # For polling batch jobs
 import urllib.parse # For URL encoding for mailto link
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed # For fetching recipes concurrently
 import pandas as pd # Import pandas for DataFrame
+import pint # For parsing and summing ingredient quantities
+import llm_cache # Persistent on-disk cache of Gemini responses
+from semantic_cache import SemanticCache # Reuses recipes for near-duplicate dish names
+from ingredient_categories import categorize_locally # Keyword tables for pantry vs perishables
+
+# The API key is read from the environment so it never appears in code or request URLs
+API_KEY = os.environ.get("GEMINI_API_KEY", "")
+GEMINI_MODEL = "gemini-2.0-flash"
+EMBEDDING_MODEL = "models/text-embedding-004"
+# The SDK has no Batch API support, so batch jobs still go through REST
+GEMINI_API_BASE = "https://generativelanguage.googleapis.com/v1beta"
+BATCH_API_URL = GEMINI_API_BASE + f"/models/{GEMINI_MODEL}:batchGenerateContent"
+
+# Batch jobs are polled with exponential backoff; give up and fall back to live calls after this long
+BATCH_POLL_TIMEOUT_SECONDS = 15 * 60
+BATCH_FAILED_STATES = {"BATCH_STATE_FAILED", "BATCH_STATE_CANCELLED", "BATCH_STATE_EXPIRED"}
+
+# Cosine similarity above which two dish names are treated as the same dish
+SEMANTIC_CACHE_THRESHOLD = 0.92
+
+# Response schemas for the structured Gemini calls
+EXTRACT_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "item": {"type": "STRING", "description": "Name of the ingredient"},
+            "quantity": {"type": "STRING", "description": "Quantity and unit (e.g., '2 cups', '500g', '1 large')"}
+        },
+        "required": ["item", "quantity"]
+    }
+}
+
+CATEGORIZE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "pantry": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "item": {"type": "STRING"},
+                    "quantity": {"type": "STRING"}
+                }
+            }
+        },
+        "perishables": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "item": {"type": "STRING"},
+                    "quantity": {"type": "STRING"}
+                }
+            }
+        }
+    },
+    "required": ["pantry", "perishables"]
+}
+
+# Ingredients of several recipes, extracted in one call
+EXTRACT_BATCH_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "dish": {"type": "STRING"},
+            "ingredients": EXTRACT_SCHEMA
+        },
+        "required": ["dish", "ingredients"]
+    }
+}
+
+# Recipe plus its parsed ingredients. The SDK's Schema has no propertyOrdering, so Gemini emits the
+# properties alphabetically; the ingredient array is named to sort after "recipe_text" so the recipe
+# streams first and can be previewed while the ingredients are still being generated.
+RECIPE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "recipe_text": {"type": "STRING", "description": "Ingredients list and preparation steps"},
+        "structured_ingredients": EXTRACT_SCHEMA
+    },
+    "required": ["recipe_text", "structured_ingredients"]
+}
+
+# Prompt templates, filled in with str.format_map. Bump llm_cache.PROMPT_VERSION when editing them.
+EXTRACT_PROMPT = """\
+For each recipe below, delimited by '--- DISH: <name> ---', extract all ingredients and their quantities.
+Return the result as a JSON array with one object per recipe, where 'dish' is the dish name exactly as written in its delimiter
+and 'ingredients' is an array where each element is an object with 'item' and 'quantity' keys.
+Quantities should include units. If no explicit quantity, state "to taste" or "as needed".
+Example ingredient: {{"item": "salt", "quantity": "1 tsp"}}, {{"item": "chicken breast", "quantity": "500g"}}
+
+{recipes}
+"""
+
+CATEGORIZE_PROMPT = """\
+Categorize the following list of ingredients into 'pantry' items and 'perishables'.
+Also, try to normalize quantities to common units where reasonable (e.g., "3 teaspoons" to "1 tablespoon").
+Return the result as a JSON object with two keys: 'pantry' and 'perishables', each containing an array of ingredient objects.
+
+Ingredients:
+{ingredient_list}
+
+Pantry items generally include non-refrigerated staples like salt, sugar, flour, spices, oils, pasta, rice, canned goods.
+Perishables include items that spoil quickly, typically needing refrigeration, like fresh meat, poultry, fish, dairy, eggs, fresh fruits, and most vegetables.
+"""
+
+# Use google_search for recipe lookup
+# This part assumes you have access to a search tool.
+# In a real Streamlit app without direct tool access like this,
+# you'd make an LLM call to get a recipe or use a dedicated recipe API.
+# For this guide, we'll simulate the search by asking the LLM for a recipe directly.
+# In a deployed setting, you'd integrate with a web search API.
+RECIPE_PROMPT = """\
+Find a top-rated recipe for '{dish_name}' for {servings} servings.
+Return the recipe AND its parsed ingredients list as a JSON object with two keys:
+'recipe_text' containing only the ingredients list and preparation steps (no introductory or concluding remarks),
+and 'structured_ingredients' containing an array where each element is an object with 'item' and 'quantity' keys.
+Quantities should include units. If no explicit quantity, state "to taste" or "as needed".
+Example ingredient: {{"item": "salt", "quantity": "1 tsp"}}, {{"item": "chicken breast", "quantity": "500g"}}
+"""
+
+@st.cache_resource
+def get_ureg():
+    """
+    Returns the unit registry used to parse ingredient quantities such as "2 cups" or "500g".
+    Building a registry is slow, so one instance is shared for the app's lifetime.
+    """
+    return pint.UnitRegistry()
+
+ureg = get_ureg()
+# Only these kitchen units are summed; anything else (e.g. "1 pinch", "2 cloves") is kept as text.
+# Single-letter abbreviations are case-sensitive ("T" is a tablespoon, "t" a teaspoon); the rest are matched lowercased.
+CASE_SENSITIVE_UNITS = {"T": "tablespoon", "t": "teaspoon", "C": "cup", "c": "cup"}
+KITCHEN_UNITS = {
+    "g": "gram", "gram": "gram", "kg": "kilogram", "kilogram": "kilogram",
+    "oz": "ounce", "ounce": "ounce", "lb": "pound", "pound": "pound",
+    "ml": "milliliter", "milliliter": "milliliter", "millilitre": "milliliter",
+    "l": "liter", "liter": "liter", "litre": "liter",
+    "tsp": "teaspoon", "teaspoon": "teaspoon",
+    "tbsp": "tablespoon", "tbs": "tablespoon", "tablespoon": "tablespoon",
+    "cup": "cup", "pint": "pint", "pt": "pint", "quart": "quart", "qt": "quart", "gallon": "gallon", "gal": "gallon"
+}
+# Labels shown on the grocery list; units not listed here are pluralized when the amount is not 1
+UNIT_LABELS = {
+    "gram": "g", "kilogram": "kg", "ounce": "oz", "pound": "lb", "milliliter": "ml", "liter": "l",
+    "teaspoon": "tsp", "tablespoon": "tbsp"
+}
+# Quantity normalization patterns, compiled once at import rather than on every ingredient
+UNICODE_FRACTIONS = str.maketrans({"½": " 1/2", "⅓": " 1/3", "⅔": " 2/3", "¼": " 1/4", "¾": " 3/4", "⅛": " 1/8", "⅜": " 3/8", "⅝": " 5/8", "⅞": " 7/8"})
+# An amount ("2", "1.5", "1/2", "1 1/2" or "1-1/2") optionally followed by a unit word
+QUANTITY_RE = re.compile(r"(?:(\d+)(?:\s+|-))?(\d+(?:\.\d+)?)(?:/(\d+))?\s*([A-Za-z][A-Za-z ]*?)?\.?")
+# A range such as "4-5"; the upper bound may not start a fraction, so "1-1/2" stays a mixed number
+RANGE_RE = re.compile(r"(\d+(?:\.\d+)?)\s*[-–]\s*(\d+(?:\.\d+)?)(?![\d/])")
+WHITESPACE_RE = re.compile(r"\s+")
+# Matches the (possibly still incomplete) "recipe_text" string within a streamed JSON response
+PARTIAL_RECIPE_TEXT_RE = re.compile(r'"recipe_text"\s*:\s*"((?:[^"\\]|\\.)*)')
+
+# Gemini rate-limits bursts of concurrent requests (HTTP 429), so keep the fan-out small
+MAX_WORKERS = 4
+MAX_RETRIES = 3
+
+# SDK calls retry rate-limited and transient server errors with exponential backoff
+REQUEST_OPTIONS = {
+    "retry": google_retry.Retry(
+        predicate=google_retry.if_exception_type(
+            google_exceptions.ResourceExhausted,
+            google_exceptions.ServiceUnavailable,
+            google_exceptions.InternalServerError
+        ),
+        initial=0.5,
+        maximum=8,
+        timeout=60
+    )
+}
+# Errors raised by the SDK, e.g. for a failed call or a missing API key
+GEMINI_API_ERRORS = (google_exceptions.GoogleAPIError, google_auth_exceptions.GoogleAuthError)
+
+@st.cache_resource
+def get_model():
+    """
+    Returns the Gemini model client shared across reruns, so its gRPC channel is reused.
+    """
+    genai.configure(api_key=API_KEY)
+    return genai.GenerativeModel(GEMINI_MODEL)
 
-# Define the API endpoint and key (leave key as empty string for Canvas)
-API_KEY = "" # The Canvas environment will inject the API key at runtime if left empty
-API_URL = "" + API_KEY
+MODEL = get_model()
 
-def call_gemini_api(prompt, schema=None):
+def make_pooled_session():
     """
-    Makes a call to the Gemini API with the given prompt.
-    If a schema is provided, it will request a structured JSON response.
+    Creates a requests Session for the Gemini Batch API that keeps TLS connections alive across calls
+    and retries rate-limited (HTTP 429) and transient server errors on status polls with exponential backoff.
+    """
+    retry = Retry(
+        total=MAX_RETRIES,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=frozenset({"GET"}), # Resubmitting the batch-creation POST could start a duplicate, billed job
+        raise_on_status=False # Hand the last response back so raise_for_status reports it
+    )
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=16, max_retries=retry))
+    return session
+
+@st.cache_resource
+def get_session():
+    """
+    Returns the pooled Session shared across reruns, so open connections are reused.
+    """
+    return make_pooled_session()
+
+SESSION = get_session()
+BATCH_HEADERS = {'Content-Type': 'application/json', 'x-goog-api-key': API_KEY}
+
+class GeminiResponseError(Exception):
+    """Raised when the Gemini API returns a response without usable content."""
+
+def build_generation_config(schema=None):
+    """
+    Builds the SDK generation config asking for JSON matching `schema`, or None for a plain-text response.
+    """
+    if not schema:
+        return None
+    return {"response_mime_type": "application/json", "response_schema": schema}
+
+def build_request_body(prompt, schema=None):
+    """
+    Builds a REST generateContent request body (as used by the Batch API) for the prompt, asking for JSON matching `schema` if one is given.
     """
     chat_history = []
     chat_history.append({"role": "user", "parts": [{"text": prompt}]})
@@ -25,133 +259,453 @@ def call_gemini_api(prompt, schema=None):
             "responseMimeType": "application/json",
             "responseSchema": schema
         }
+    return payload
 
+@st.cache_data(ttl=3600, max_entries=256, show_spinner=False)
+def generate_content(prompt, schema=None):
+    """
+    Sends the prompt to the Gemini API and returns the (parsed, if a schema is given) response.
+    Results are memoized in memory across Streamlit reruns and cached on disk, keyed by prompt and schema.
+    Failures raise instead of returning None, so they are never memoized.
+    """
+    cache_key = llm_cache.make_key(prompt, schema)
+    text_response = llm_cache.get(cache_key)
+    if text_response is not None:
+        try:
+            return orjson.loads(text_response) if schema else text_response
+        except json.JSONDecodeError:
+            pass # Fall through and refetch a corrupt entry
+
+    response = MODEL.generate_content(prompt, generation_config=build_generation_config(schema), request_options=REQUEST_OPTIONS)
     try:
-        response = requests.post(API_URL, headers={'Content-Type': 'application/json'}, json=payload)
-        response.raise_for_status() # Raise an exception for HTTP errors
-        result = response.json()
-
-        if result.get("candidates") and result["candidates"][0].get("content") and result["candidates"][0]["content"].get("parts"):
-            text_response = result["candidates"][0]["content"]["parts"][0].get("text")
-            if schema:
-                return json.loads(text_response) # Parse JSON if schema was used
-            return text_response
-        else:
-            st.error(f"Unexpected API response structure: {result}")
-            return None
-    except requests.exceptions.RequestException as e:
-        st.error(f"Error calling Gemini API: {e}")
+        text_response = response.text
+    except ValueError: # Raised when the response has no text parts, e.g. if it was blocked
+        raise GeminiResponseError(f"Unexpected API response structure: {response}")
+    if not text_response:
+        raise GeminiResponseError(f"Empty response from Gemini API: {response}")
+
+    parsed = orjson.loads(text_response) if schema else text_response # Parse JSON if schema was used
+    llm_cache.set(cache_key, text_response)
+    return parsed
+
+def call_gemini_api(prompt, schema=None, on_error=None):
+    """
+    Makes a call to the Gemini API with the given prompt.
+    If a schema is provided, it will request a structured JSON response.
+    Errors are reported through `on_error` (defaults to `st.error`), so calls made
+    from worker threads can defer their messages to the main script thread.
+    """
+    if on_error is None:
+        on_error = st.error
+
+    try:
+        return generate_content(prompt, schema)
+    except GeminiResponseError as e:
+        on_error(str(e))
+        return None
+    except GEMINI_API_ERRORS as e:
+        on_error(f"Error calling Gemini API: {e}")
         return None
     except json.JSONDecodeError as e:
-        st.error(f"Error decoding JSON response from Gemini API: {e}")
+        on_error(f"Error decoding JSON response from Gemini API: {e}")
         return None
 
-def extract_ingredients(recipe_text):
+def call_gemini_api_stream(prompt, schema=None):
     """
-    Uses LLM to extract ingredients and quantities from raw recipe text.
-    It expects the LLM to return a JSON array of objects.
+    Streams a Gemini response, yielding text chunks as they arrive.
+    Unlike call_gemini_api this is neither cached nor error-handled; callers handle GEMINI_API_ERRORS.
     """
-    schema = {
-        "type": "ARRAY",
-        "items": {
-            "type": "OBJECT",
-            "properties": {
-                "item": {"type": "STRING", "description": "Name of the ingredient"},
-                "quantity": {"type": "STRING", "description": "Quantity and unit (e.g., '2 cups', '500g', '1 large')"}
-            },
-            "required": ["item", "quantity"]
-        }
-    }
-    prompt = f"""
-    From the following recipe text, extract all ingredients and their quantities.
-    Return the result as a JSON array where each element is an object with 'item' and 'quantity' keys.
-    Quantities should include units. If no explicit quantity, state "to taste" or "as needed".
-    Example: {{"item": "salt", "quantity": "1 tsp"}}, {{"item": "chicken breast", "quantity": "500g"}}
+    response = MODEL.generate_content(prompt, generation_config=build_generation_config(schema), stream=True)
+    for chunk in response:
+        if chunk.parts:
+            yield chunk.text
 
-    Recipe Text:
-    {recipe_text}
+def stream_recipe_text(chunks, collected):
+    """
+    Yields the 'recipe_text' field of a streamed recipe JSON response as it is generated,
+    so it can be shown live with st.write_stream. Every raw chunk is appended to `collected`
+    so the complete response can be parsed once the stream ends.
+    """
+    shown = 0
+    for chunk in chunks:
+        collected.append(chunk)
+        match = PARTIAL_RECIPE_TEXT_RE.search("".join(collected))
+        if not match:
+            continue
+        try:
+            recipe_text = orjson.loads(f'"{match.group(1)}"')
+        except json.JSONDecodeError:
+            continue # Stream stopped mid-escape sequence; wait for the next chunk
+        if len(recipe_text) > shown:
+            yield recipe_text[shown:]
+            shown = len(recipe_text)
+
+@st.cache_data(ttl=3600, max_entries=256, show_spinner=False)
+def embed_text(text):
+    """
+    Returns the embedding vector of the given text using Gemini's text-embedding-004 model.
+    Raises on failure, like generate_content.
     """
-    return call_gemini_api(prompt, schema)
+    values = genai.embed_content(model=EMBEDDING_MODEL, content=text, request_options=REQUEST_OPTIONS).get("embedding")
+    if not values:
+        raise GeminiResponseError("Empty embedding returned by Gemini API")
+    return values
+
+@st.cache_resource
+def get_semantic_cache():
+    """
+    Returns the process-wide semantic cache of dish recipes.
+    """
+    return SemanticCache(threshold=SEMANTIC_CACHE_THRESHOLD)
+
+def extract_ingredients(recipes_by_dish):
+    """
+    Uses LLM to extract ingredients and quantities from the raw text of several recipes in a single call.
+    `recipes_by_dish` maps dish names to recipe text. Returns a dict mapping each dish name
+    to its list of {'item', 'quantity'} objects; dishes the LLM did not return are left out.
+    """
+    recipes = "\n\n".join(f"--- DISH: {dish_name} ---\n{recipe_text}" for dish_name, recipe_text in recipes_by_dish.items())
+    prompt = EXTRACT_PROMPT.format_map({"recipes": recipes})
+    result = call_gemini_api(prompt, EXTRACT_BATCH_SCHEMA) or []
+
+    dish_names = {dish_name.lower(): dish_name for dish_name in recipes_by_dish}
+    ingredients_by_dish = {}
+    for entry in result:
+        dish_name = dish_names.get(entry.get('dish', '').strip().lower())
+        if dish_name and entry.get('ingredients'):
+            ingredients_by_dish[dish_name] = entry['ingredients']
+    return ingredients_by_dish
 
 def categorize_and_normalize_ingredients(ingredient_list_json):
     """
     Uses LLM to categorize ingredients and standardize quantities.
     It expects the LLM to return a JSON object with 'pantry' and 'perishables' arrays.
     """
-    schema = {
-        "type": "OBJECT",
-        "properties": {
-            "pantry": {
-                "type": "ARRAY",
-                "items": {
-                    "type": "OBJECT",
-                    "properties": {
-                        "item": {"type": "STRING"},
-                        "quantity": {"type": "STRING"}
-                    }
-                }
-            },
-            "perishables": {
-                "type": "ARRAY",
-                "items": {
-                    "type": "OBJECT",
-                    "properties": {
-                        "item": {"type": "STRING"},
-                        "quantity": {"type": "STRING"}
-                    }
-                }
-            }
-        },
-        "required": ["pantry", "perishables"]
-    }
-
     prompt_ingredient_list = "\n".join([f"- {item['item']}: {item['quantity']}" for item in ingredient_list_json])
+    prompt = CATEGORIZE_PROMPT.format_map({"ingredient_list": prompt_ingredient_list})
+    return call_gemini_api(prompt, CATEGORIZE_SCHEMA)
 
-    prompt = f"""
-    Categorize the following list of ingredients into 'pantry' items and 'perishables'.
-    Also, try to normalize quantities to common units where reasonable (e.g., "3 teaspoons" to "1 tablespoon").
-    Return the result as a JSON object with two keys: 'pantry' and 'perishables', each containing an array of ingredient objects.
+def categorize_ingredients(ingredients):
+    """
+    Splits ingredients into pantry items and perishables.
+    Common ingredients are categorized locally from keyword tables; only the unrecognized
+    ones are sent to the LLM, in a single call. Returns None if that call fails.
+    """
+    categorized, unknown = categorize_locally(ingredients)
+    if unknown:
+        categorized_by_llm = categorize_and_normalize_ingredients(unknown)
+        if not categorized_by_llm:
+            return None
+        for category in ('pantry', 'perishables'):
+            categorized[category].extend(categorized_by_llm.get(category, []))
+    return categorized
 
-    Ingredients:
-    {prompt_ingredient_list}
+def lookup_unit(unit):
+    """
+    Returns the pint unit name for a recipe unit like "T", "Tbsp" or "cups", or None if it is not a kitchen unit.
+    """
+    if unit in CASE_SENSITIVE_UNITS:
+        return CASE_SENSITIVE_UNITS[unit]
+    unit = unit.lower()
+    if unit not in KITCHEN_UNITS and unit.endswith("s"):
+        unit = unit[:-1] # "cups" -> "cup", "lbs" -> "lb"
+    return KITCHEN_UNITS.get(unit)
+
+def parse_quantity(quantity):
+    """
+    Parses a quantity string like "1½ cups", "1-1/2 cups", "500g", "1 T" or "4-5" into a pint Quantity.
+    Ranges take their upper bound. Returns None for quantities that cannot be summed
+    (e.g. "to taste", "2 cloves").
+    """
+    text = quantity.strip().translate(UNICODE_FRACTIONS).strip()
+    text = RANGE_RE.sub(r"\2", text)
+    match = QUANTITY_RE.fullmatch(text)
+    if not match:
+        return None
+    whole, number, denominator, unit = match.groups()
+    if denominator and int(denominator) == 0:
+        return None
+    amount = float(number) / int(denominator) if denominator else float(number)
+    if whole:
+        amount += int(whole)
+
+    if not unit:
+        return ureg.Quantity(amount) # A plain count, e.g. "2" eggs
+    unit_name = lookup_unit(unit.strip())
+    if unit_name is None:
+        return None
+    return ureg.Quantity(amount, unit_name)
 
-    Pantry items generally include non-refrigerated staples like salt, sugar, flour, spices, oils, pasta, rice, canned goods.
-    Perishables include items that spoil quickly, typically needing refrigeration, like fresh meat, poultry, fish, dairy, eggs, fresh fruits, and most vegetables.
+def format_quantity(quantity):
     """
-    return call_gemini_api(prompt, schema)
+    Formats a pint Quantity for the grocery list, e.g. "1.12 cups", "1500 g" or "3".
+    """
+    magnitude = f"{quantity.magnitude:.2f}".rstrip("0").rstrip(".")
+    if quantity.dimensionless:
+        return magnitude
+    unit_name = str(quantity.units)
+    label = UNIT_LABELS.get(unit_name)
+    if label is None:
+        label = unit_name if magnitude == "1" else unit_name + "s"
+    return f"{magnitude} {label}"
+
+def sum_quantities(quantities):
+    """
+    Sums a list of quantity strings. Compatible quantities are added up numerically
+    (e.g. "1 cup" + "2 tbsp" -> "1.12 cups"), and the rest are joined with " + ".
+    """
+    totals = {} # Keyed by dimensionality, summed in the unit that appeared first
+    originals = defaultdict(list)
+    unparsed = []
+    for quantity in quantities:
+        parsed = parse_quantity(quantity)
+        if parsed is None:
+            unparsed.append(quantity)
+            continue
+        originals[parsed.dimensionality].append(quantity)
+        if parsed.dimensionality in totals:
+            totals[parsed.dimensionality] += parsed
+        else:
+            totals[parsed.dimensionality] = parsed
+
+    # A quantity with nothing to add to keeps its original wording (e.g. "2 cups" rather than "2 cup")
+    summed = [
+        originals[dimensionality][0] if len(originals[dimensionality]) == 1 else format_quantity(total)
+        for dimensionality, total in totals.items()
+    ]
+    return " + ".join(summed + unparsed)
 
 def aggregate_ingredients(categorized_ingredients):
     """
     Aggregates quantities for duplicate ingredients within categories.
-    This is a simplified aggregation. More advanced aggregation would require
-    unit parsing and conversion (e.g., grams to ounces).
-    For this low-code solution, we sum up if units match exactly or
-    flag for manual review if units are complex/different.
-    """
-    aggregated_pantry = {}
-    aggregated_perishables = {}
-
-    for item in categorized_ingredients.get('pantry', []):
-        name = item['item'].lower()
-        if name in aggregated_pantry:
-            # Simple aggregation: append quantities if they can't be easily summed
-            aggregated_pantry[name] += f" + {item['quantity']}"
-        else:
-            aggregated_pantry[name] = item['quantity']
+    Quantities with compatible units are summed (e.g. "1 cup" and "2 tbsp");
+    quantities that cannot be parsed or converted are joined with " + " for manual review.
+    """
+    aggregated = {}
+    for category in ('pantry', 'perishables'):
+        quantities_by_name = defaultdict(list)
+        for item in categorized_ingredients.get(category, []):
+            # Normalize case and whitespace so "Chicken " and "chicken" merge; interned keys hash and compare faster
+            name = sys.intern(WHITESPACE_RE.sub(" ", item['item'].strip().lower()))
+            quantities_by_name[name].append(item['quantity'])
+
+        # Convert back to list of dicts for consistent output
+        aggregated[category] = [{"item": k.title(), "quantity": sum_quantities(v)} for k, v in quantities_by_name.items()]
+
+    return aggregated
 
-    for item in categorized_ingredients.get('perishables', []):
-        name = item['item'].lower()
-        if name in aggregated_perishables:
-            aggregated_perishables[name] += f" + {item['quantity']}"
+def build_recipe_request(dish_name, servings):
+    """
+    Builds the prompt and response schema asking for a recipe and its parsed ingredients.
+    The LLM is expected to return a JSON object with 'recipe_text' and 'structured_ingredients' keys,
+    where 'structured_ingredients' is an array of {'item', 'quantity'} objects.
+    """
+    prompt = RECIPE_PROMPT.format_map({"dish_name": dish_name, "servings": servings})
+    return prompt, RECIPE_SCHEMA
+
+def find_recipe_with_ingredients(dish_name, servings, on_error=None):
+    """
+    Uses LLM to find a recipe and extract its ingredients in a single call.
+    """
+    prompt, schema = build_recipe_request(dish_name, servings)
+    return call_gemini_api(prompt, schema, on_error=on_error)
+
+def summarize_dish_result(dish_name, servings, result, messages):
+    """
+    Unpacks a recipe result into (dish_name, servings, recipe_text, ingredients, messages),
+    adding a message that describes whether the recipe was found.
+    """
+    recipe_content = result.get("recipe_text") if result else None
+
+    ingredients = None
+    if recipe_content:
+        messages.append(("info", f"Recipe found for **{dish_name}**."))
+        ingredients = result.get("structured_ingredients")
+    else:
+        messages.append(("warning", f"Could not find a recipe for {dish_name}. Skipping this dish."))
+
+    return dish_name, servings, recipe_content, ingredients, messages
+
+def merge_duplicate_dishes(dishes):
+    """
+    Merges dishes listed more than once (case-insensitively) into a single entry with the
+    combined servings, so each distinct dish is looked up only once.
+    """
+    merged = {}
+    for dish_entry in dishes:
+        key = " ".join(dish_entry['name'].lower().split())
+        if key in merged:
+            merged[key]['servings'] += dish_entry['servings']
         else:
-            aggregated_perishables[name] = item['quantity']
+            merged[key] = dict(dish_entry)
+    return list(merged.values())
 
-    # Convert back to list of dicts for consistent output
-    final_pantry = [{"item": k.title(), "quantity": v} for k, v in aggregated_pantry.items()]
-    final_perishables = [{"item": k.title(), "quantity": v} for k, v in aggregated_perishables.items()]
+def lookup_semantic_cache(dish_name, servings):
+    """
+    Embeds the dish name and looks it up in the semantic cache.
+    Returns (embedding, cached result); either may be None, and without an embedding the cache is skipped.
+    """
+    try:
+        embedding = embed_text(dish_name.lower())
+    except GEMINI_API_ERRORS + (GeminiResponseError,):
+        return None, None
+    return embedding, get_semantic_cache().get(embedding, servings)
 
-    return {"pantry": final_pantry, "perishables": final_perishables}
+def store_semantic_cache(embedding, servings, result):
+    """
+    Adds a complete recipe result to the semantic cache, if the dish name could be embedded.
+    """
+    if embedding and result and result.get("recipe_text") and result.get("structured_ingredients"):
+        get_semantic_cache().set(embedding, servings, result)
 
+def fetch_dish(dish_name, servings):
+    """
+    Fetches a recipe and its ingredients for one dish.
+    Runs on a worker thread, so it must not touch Streamlit elements directly;
+    any messages are returned as (level, text) tuples for the main thread to render.
+    """
+    messages = []
+    on_error = lambda msg: messages.append(("error", msg))
+
+    embedding, result = lookup_semantic_cache(dish_name, servings)
+    if result is None:
+        result = find_recipe_with_ingredients(dish_name, servings, on_error=on_error)
+        store_semantic_cache(embedding, servings, result)
+
+    return summarize_dish_result(dish_name, servings, result, messages)
+
+def stream_dish(dish_name, servings):
+    """
+    Fetches a recipe and its ingredients for one dish, showing the recipe text live as it is generated.
+    Must run on the main script thread. Cached responses, including semantic cache hits,
+    are returned without streaming.
+    """
+    prompt, schema = build_recipe_request(dish_name, servings)
+    cache_key = llm_cache.make_key(prompt, schema)
+    if llm_cache.get(cache_key) is not None:
+        return fetch_dish(dish_name, servings)
+
+    embedding, result = lookup_semantic_cache(dish_name, servings)
+    if result is not None:
+        return summarize_dish_result(dish_name, servings, result, [])
+
+    messages = []
+    collected = []
+    result = None
+    try:
+        st.markdown(f"**Recipe for {dish_name}**")
+        st.write_stream(stream_recipe_text(call_gemini_api_stream(prompt, schema), collected))
+        text_response = "".join(collected)
+        result = orjson.loads(text_response)
+        llm_cache.set(cache_key, text_response)
+        store_semantic_cache(embedding, servings, result)
+    except GEMINI_API_ERRORS as e:
+        messages.append(("error", f"Error calling Gemini API: {e}"))
+    except json.JSONDecodeError as e:
+        messages.append(("error", f"Error decoding JSON response from Gemini API: {e}"))
+    except (generation_types.BlockedPromptException, generation_types.StopCandidateException, ValueError) as e:
+        # Raised by the stream when the prompt is blocked or a candidate stops early, e.g. for safety
+        messages.append(("error", f"Unexpected API response structure: {e}"))
+
+    return summarize_dish_result(dish_name, servings, result, messages)
+
+def cancel_recipe_batch(batch_name):
+    """
+    Asks the Gemini Batch API to cancel a batch job. Best effort: failures are ignored,
+    since the caller is already giving up on the job.
+    """
+    try:
+        SESSION.post(f"{GEMINI_API_BASE}/{batch_name}:cancel", headers=BATCH_HEADERS)
+    except requests.exceptions.RequestException:
+        pass
+
+def run_recipe_batch(requests_by_key):
+    """
+    Submits recipe requests to the Gemini Batch API, which costs about half as much as live calls
+    but may take minutes to complete. `requests_by_key` maps a key to a (prompt, schema) pair.
+    Polls with exponential backoff and returns a dict of key -> raw response text.
+    Raises on failure or if the batch does not finish within BATCH_POLL_TIMEOUT_SECONDS.
+    """
+    batch_requests = [
+        {
+            "request": build_request_body(prompt, schema),
+            "metadata": {"key": key}
+        }
+        for key, (prompt, schema) in requests_by_key.items()
+    ]
+    payload = {"batch": {"display_name": "grocery-list-recipes", "input_config": {"requests": {"requests": batch_requests}}}}
+    response = SESSION.post(BATCH_API_URL, headers=BATCH_HEADERS, data=orjson.dumps(payload))
+    response.raise_for_status()
+    batch_name = orjson.loads(response.content)["name"]
+
+    delay = 2
+    deadline = time.monotonic() + BATCH_POLL_TIMEOUT_SECONDS
+    while True:
+        time.sleep(delay)
+        response = SESSION.get(f"{GEMINI_API_BASE}/{batch_name}", headers=BATCH_HEADERS)
+        response.raise_for_status()
+        batch = orjson.loads(response.content)
+        state = batch.get("metadata", {}).get("state")
+        if batch.get("done") or state == "BATCH_STATE_SUCCEEDED":
+            break
+        if state in BATCH_FAILED_STATES:
+            raise GeminiResponseError(f"Gemini batch job ended in state {state}")
+        if time.monotonic() > deadline:
+            cancel_recipe_batch(batch_name) # The live fallback would otherwise be billed on top of the batch
+            raise GeminiResponseError("Gemini batch job did not finish in time")
+        delay = min(delay * 2, 60)
+
+    if batch.get("error"):
+        raise GeminiResponseError(f"Gemini batch job failed: {batch['error']}")
+    text_by_key = {}
+    inlined = batch.get("response", {}).get("inlinedResponses", {}).get("inlinedResponses", [])
+    for entry in inlined:
+        candidates = entry.get("response", {}).get("candidates") or [{}]
+        parts = candidates[0].get("content", {}).get("parts") or [{}]
+        if parts[0].get("text"):
+            text_by_key[entry.get("metadata", {}).get("key")] = parts[0]["text"]
+    return text_by_key
+
+def fetch_dishes_batch(dishes):
+    """
+    Fetches recipes and ingredients for all dishes through the Gemini Batch API.
+    Dishes already in the on-disk cache are not resubmitted, and batch results are cached
+    so later live calls for the same dishes are served locally. Dishes the batch returned
+    no response for are fetched live with fetch_dish.
+    Returns results in the same shape as fetch_dish, in the order of `dishes`.
+    """
+    requests_by_key = {}
+    text_by_key = {}
+    keys = []
+    for dish_entry in dishes:
+        prompt, schema = build_recipe_request(dish_entry['name'].strip(), dish_entry['servings'])
+        key = llm_cache.make_key(prompt, schema)
+        keys.append(key)
+        cached = llm_cache.get(key)
+        if cached is not None:
+            text_by_key[key] = cached
+        else:
+            requests_by_key[key] = (prompt, schema)
+
+    if requests_by_key:
+        for key, text in run_recipe_batch(requests_by_key).items():
+            llm_cache.set(key, text)
+            text_by_key[key] = text
+
+    results = []
+    for dish_entry, key in zip(dishes, keys):
+        dish_name, servings = dish_entry['name'].strip(), dish_entry['servings']
+        if key not in text_by_key:
+            results.append(fetch_dish(dish_name, servings))
+            continue
+        messages = []
+        try:
+            result = orjson.loads(text_by_key[key])
+        except json.JSONDecodeError as e:
+            messages.append(("error", f"Error decoding JSON response from Gemini API: {e}"))
+            result = None
+        results.append(summarize_dish_result(dish_name, servings, result, messages))
+    return results
 
 st.set_page_config(layout="wide", page_title="AI Grocery Shopping Assistant")
 st.title("🛒 AI-Powered Shopping Assistant")
@@ -165,6 +719,10 @@ def add_dish():
 
 def remove_dish(index):
     if len(st.session_state.dishes) > 1:
+        # Widget keys are positional, so shift the values of the following dishes up by one
+        for j in range(index, len(st.session_state.dishes) - 1):
+            st.session_state[f"dish_name_{j}"] = st.session_state.get(f"dish_name_{j+1}", "")
+            st.session_state[f"servings_{j}"] = st.session_state.get(f"servings_{j+1}", 1)
         st.session_state.dishes.pop(index)
 
 col1, col2 = st.columns([3, 1])
@@ -175,20 +733,19 @@ with col2:
     st.button("➕ Add Another Dish", on_click=add_dish)
 
 
-for i, dish in enumerate(st.session_state.dishes):
+# The widget keys hold each dish's name and servings; they are read back only when generating the list
+for i in range(len(st.session_state.dishes)):
     cols = st.columns([4, 2, 1])
     with cols[0]:
-        st.session_state.dishes[i]['name'] = st.text_input(
+        st.text_input(
             f"Dish {i+1} Name",
-            value=dish['name'],
             key=f"dish_name_{i}",
             placeholder="e.g., Chicken Tikka Masala"
         )
     with cols[1]:
-        st.session_state.dishes[i]['servings'] = st.number_input(
+        st.number_input(
             f"Servings",
             min_value=1,
-            value=dish['servings'],
             key=f"servings_{i}"
         )
     with cols[2]:
@@ -198,53 +755,101 @@ for i, dish in enumerate(st.session_state.dishes):
 
 st.markdown("---")
 
+use_batch = st.toggle(
+    "Use Gemini Batch API",
+    help="Fetches recipes at about half the cost, but can take several minutes. Falls back to live calls if the batch fails."
+)
+
 if st.button("Generate Grocery List", type="primary"):
     all_recipes_text = ""
     total_ingredients_extracted = []
     loading_messages = [] # For a more detailed loading message
 
-    valid_dishes = [d for d in st.session_state.dishes if d['name'].strip()]
+    dishes = [
+        {'name': st.session_state[f"dish_name_{i}"].strip(), 'servings': st.session_state[f"servings_{i}"]}
+        for i in range(len(st.session_state.dishes))
+    ]
+    valid_dishes = [d for d in dishes if d['name']]
 
     if not valid_dishes:
         st.warning("Please add at least one dish name to generate the grocery list.")
     else:
-        progress_bar = st.progress(0)
-        status_text = st.empty()
-
-        for i, dish_entry in enumerate(valid_dishes):
-            dish_name = dish_entry['name'].strip()
-            servings = dish_entry['servings']
-
-            status_text.text(f"Searching for top-rated recipe for {dish_name}...")
-            # Use google_search for recipe lookup
-            # This part assumes you have access to a search tool.
-            # In a real Streamlit app without direct tool access like this,
-            # you'd make an LLM call to get a recipe or use a dedicated recipe API.
-            # For this guide, we'll simulate the search by asking the LLM for a recipe directly.
-            # In a deployed setting, you'd integrate with a web search API.
-
-            recipe_prompt = f"Find a top-rated recipe for '{dish_name}' for {servings} servings. Provide only the ingredients list and preparation steps. Do not include introductory or concluding remarks."
-            recipe_content = call_gemini_api(recipe_prompt)
-
-            if recipe_content:
-                st.info(f"Recipe found for **{dish_name}**.")
-                all_recipes_text += f"\n\n--- Recipe for {dish_name} ({servings} servings) ---\n{recipe_content}"
-
-                status_text.text(f"Extracting ingredients for {dish_name}...")
-                ingredients_for_dish = extract_ingredients(recipe_content)
-
+        merged_dishes = merge_duplicate_dishes(valid_dishes)
+        if len(merged_dishes) < len(valid_dishes):
+            st.info("Dishes listed more than once were combined into a single recipe with their total servings.")
+        valid_dishes = merged_dishes
+
+        # Warnings and errors are collected here and rendered below the status block, which collapses when done
+        notices = []
+        with st.status("Generating grocery list...", expanded=True) as status:
+            results = None
+            if use_batch:
+                status.update(label=f"Waiting for the Gemini Batch API to fetch recipes for {len(valid_dishes)} dish(es)...")
+                try:
+                    results = fetch_dishes_batch(valid_dishes)
+                except (requests.exceptions.RequestException, GeminiResponseError, KeyError, json.JSONDecodeError) as e:
+                    notices.append(("warning", f"Batch request failed ({e}). Fetching recipes directly instead."))
+
+            if results is None and len(valid_dishes) == 1:
+                # With nothing to fan out, stream the single recipe so it appears while it is generated
+                dish_entry = valid_dishes[0]
+                status.update(label=f"Searching for top-rated recipe for {dish_entry['name'].strip()}...")
+                results = [stream_dish(dish_entry['name'].strip(), dish_entry['servings'])]
+
+            if results is None:
+                status.update(label=f"Fetched 0/{len(valid_dishes)} recipes...")
+                results = [None] * len(valid_dishes)
+                # Workers call cached functions, which need the script's run context to avoid warnings
+                with ThreadPoolExecutor(
+                    max_workers=min(MAX_WORKERS, len(valid_dishes)),
+                    initializer=add_script_run_ctx,
+                    initargs=(None, get_script_run_ctx())
+                ) as executor:
+                    futures = {
+                        executor.submit(fetch_dish, dish_entry['name'].strip(), dish_entry['servings']): i
+                        for i, dish_entry in enumerate(valid_dishes)
+                    }
+                    for done, future in enumerate(as_completed(futures), start=1):
+                        result = future.result()
+                        results[futures[future]] = result
+                        status.write(f"✓ {result[0]}" if result[2] else f"✗ {result[0]}")
+                        status.update(label=f"Fetched {done}/{len(valid_dishes)} recipes...")
+
+            # Recipes that came back without a parsed ingredient list are extracted together in one call
+            recipes_missing_ingredients = {
+                dish_name: recipe_content
+                for dish_name, _, recipe_content, ingredients_for_dish, _ in results
+                if recipe_content and not ingredients_for_dish
+            }
+            extracted_ingredients = {}
+            if recipes_missing_ingredients:
+                status.update(label=f"Extracting ingredients for {len(recipes_missing_ingredients)} recipe(s)...")
+                extracted_ingredients = extract_ingredients(recipes_missing_ingredients)
+
+            # Messages are rendered only after the pool has joined; Streamlit calls are not safe from worker threads
+            for dish_name, servings, recipe_content, ingredients_for_dish, messages in results:
+                notices.extend(messages)
+                ingredients_for_dish = ingredients_for_dish or extracted_ingredients.get(dish_name)
+                if recipe_content and not ingredients_for_dish:
+                    notices.append(
+                        ("warning", f"Could not extract ingredients for {dish_name}. Please check the dish name or try again.")
+                    )
+                if recipe_content:
+                    all_recipes_text += f"\n\n--- Recipe for {dish_name} ({servings} servings) ---\n{recipe_content}"
                 if ingredients_for_dish:
                     total_ingredients_extracted.extend(ingredients_for_dish)
-                else:
-                    st.warning(f"Could not extract ingredients for {dish_name}. Please check the dish name or try again.")
+
+            status.update(label="Processing all ingredients...")
+            categorized_and_normalized = categorize_ingredients(total_ingredients_extracted) if total_ingredients_extracted else None
+            if categorized_and_normalized:
+                status.update(label="Grocery list ready", state="complete", expanded=False)
             else:
-                st.warning(f"Could not find a recipe for {dish_name}. Skipping this dish.")
+                status.update(label="Could not generate the grocery list", state="error")
 
-            progress_bar.progress((i + 1) / len(valid_dishes))
+        for level, message in notices:
+            getattr(st, level)(message)
 
-        status_text.text("Processing all ingredients...")
         if total_ingredients_extracted:
-            categorized_and_normalized = categorize_and_normalize_ingredients(total_ingredients_extracted)
             if categorized_and_normalized:
                 final_grocery_list = aggregate_ingredients(categorized_and_normalized)
 
@@ -322,9 +927,6 @@ if st.button("Generate Grocery List", type="primary"):
         else:
             st.error("No ingredients could be extracted from the recipes. Please try different dish names.")
 
-        progress_bar.empty()
-        status_text.empty()
-
 st.sidebar.header("About This App")
 st.sidebar.info(
     "This AI agent helps you generate a grocery list from your weekly meal plan. "
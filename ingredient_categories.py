@@ -0,0 +1,113 @@
+# ingredient_categories.py
+
+import re
+
+# Shelf-stable staples. Multi-word entries take precedence over the single words they contain
+# (e.g. "peanut butter" is pantry even though "butter" is perishable).
+PANTRY_KEYWORDS = {
+    # Salt, sugar and sweeteners
+    "salt", "sea salt", "kosher salt", "sugar", "brown sugar", "powdered sugar", "icing sugar", "honey",
+    "maple syrup", "molasses", "corn syrup", "agave", "jaggery", "sweetener",
+    # Flours, grains, pasta and legumes
+    "flour", "all-purpose flour", "bread flour", "cornflour", "cornmeal", "cornstarch", "corn starch", "semolina",
+    "rice", "basmati", "quinoa", "couscous", "bulgur", "barley", "oats", "oatmeal", "pasta", "spaghetti",
+    "penne", "macaroni", "fettuccine", "linguine", "lasagna noodles", "noodles", "ramen", "vermicelli",
+    "breadcrumbs", "bread crumbs", "panko", "crackers", "cornflakes", "cereal", "tortilla chips", "lentils",
+    "dal", "chickpeas", "kidney beans", "black beans", "pinto beans", "cannellini beans", "split peas",
+    # Baking
+    "baking powder", "baking soda", "yeast", "cocoa", "cocoa powder", "chocolate chips", "vanilla",
+    "vanilla extract", "gelatin", "cream of tartar",
+    # Oils, vinegars and condiments
+    "oil", "olive oil", "vegetable oil", "canola oil", "sesame oil", "coconut oil", "ghee", "cooking spray",
+    "vinegar", "balsamic vinegar", "rice vinegar", "soy sauce", "fish sauce", "oyster sauce",
+    "worcestershire sauce", "hot sauce", "sriracha", "ketchup", "mustard", "dijon mustard", "mayonnaise",
+    "tomato paste", "tomato sauce", "passata", "salsa", "pesto", "curry paste", "tahini", "peanut butter",
+    "jam", "stock cube", "bouillon", "broth", "stock", "chicken broth", "chicken stock", "beef broth",
+    "beef stock", "vegetable broth", "vegetable stock", "coconut milk", "coconut cream",
+    "evaporated milk", "condensed milk", "capers", "olives",
+    # Spices and dried herbs
+    "pepper", "black pepper", "white pepper", "peppercorns", "red pepper flakes", "chili flakes",
+    "chili powder", "chilli powder", "cayenne", "paprika", "smoked paprika", "cumin", "coriander powder",
+    "ground coriander", "turmeric", "garam masala", "curry powder", "cinnamon", "nutmeg", "cloves",
+    "cardamom", "allspice", "ginger powder", "ground ginger", "garlic powder", "onion powder", "oregano",
+    "dried oregano", "thyme", "dried thyme", "rosemary", "bay leaf", "bay leaves", "sage", "fennel seeds",
+    "mustard seeds", "fenugreek", "saffron", "star anise", "italian seasoning", "seasoning", "spice",
+    "sesame seeds",
+    # Nuts and dried fruit
+    "almonds", "walnuts", "pecans", "cashews", "peanuts", "pistachios", "pine nuts", "raisins",
+    "dried cranberries", "dates", "coconut flakes", "desiccated coconut",
+    # Drinks and misc.
+    "coffee", "tea", "wine", "cooking wine", "water",
+}
+
+# Items that spoil quickly and typically need refrigeration
+PERISHABLE_KEYWORDS = {
+    # Meat, poultry and seafood
+    "chicken", "chicken breast", "chicken thighs", "turkey", "duck", "beef", "ground beef", "steak", "pork",
+    "bacon", "ham", "sausage", "chorizo", "pepperoni", "salami", "lamb", "mutton", "veal", "mince",
+    "prosciutto", "pancetta",
+    "fish", "salmon", "tuna steak", "cod", "tilapia", "halibut", "shrimp", "prawns", "scallops", "crab",
+    "lobster", "mussels", "clams", "squid",
+    # Dairy and eggs
+    "egg", "milk", "butter", "cream", "heavy cream", "sour cream", "whipping cream", "buttermilk",
+    "yogurt", "yoghurt", "cheese", "parmesan", "mozzarella", "cheddar", "feta", "ricotta", "paneer",
+    "cream cheese", "mascarpone", "pepper jack", "tofu",
+    # Vegetables
+    "onion", "red onion", "green onion", "spring onion", "scallion", "shallot", "garlic", "garlic clove",
+    "ginger", "potato", "sweet potato", "carrot", "celery", "tomato", "cherry tomatoes", "lettuce", "spinach",
+    "kale", "cabbage", "broccoli", "cauliflower", "zucchini", "courgette", "eggplant", "aubergine",
+    "cucumber", "bell pepper", "red bell pepper", "green pepper", "red pepper", "jalapeno", "chili",
+    "chilli", "green chili", "mushroom", "peas", "sugar snap peas", "snap peas", "snow peas", "green beans",
+    "corn", "asparagus", "leek", "beet", "radish", "okra", "squash", "pumpkin", "arugula", "bok choy", "sprouts",
+    # Fresh herbs
+    "cilantro", "coriander leaves", "parsley", "basil", "mint", "dill", "chives", "curry leaves",
+    "lemongrass",
+    # Fruit
+    "lemon", "lime", "orange", "apple", "banana", "berries", "strawberries", "blueberries",
+    "raspberries", "grapes", "mango", "pineapple", "avocado", "peach", "pear",
+    # Bakery
+    "bread", "baguette", "tortillas", "pita", "naan", "buns",
+}
+
+# Modifiers that settle the category regardless of the ingredient itself
+PERISHABLE_MODIFIER_RE = re.compile(r"\b(fresh|frozen)\b")
+PANTRY_MODIFIER_RE = re.compile(r"\b(canned|tinned|jarred|dried|dry)\b")
+
+# One alternation over all keywords, longest first so "peanut butter" wins over "butter";
+# a keyword may take a plural ending ("eggs", "tomatoes") but must otherwise end on a word boundary,
+# so "pepper" does not match "pepperoni"
+_CATEGORY_BY_KEYWORD = {**{k: "pantry" for k in PANTRY_KEYWORDS}, **{k: "perishables" for k in PERISHABLE_KEYWORDS}}
+KEYWORD_RE = re.compile(
+    r"\b(" + "|".join(re.escape(k) for k in sorted(_CATEGORY_BY_KEYWORD, key=len, reverse=True)) + r")(?:e?s)?\b"
+)
+
+def categorize_ingredient(name):
+    """
+    Returns 'pantry' or 'perishables' for an ingredient name, or None if it is not recognized.
+    When several keywords match, the longest one decides; among equally long ones the last,
+    usually the head noun ("pepper jack cheese" is cheese), wins.
+    """
+    name = name.lower()
+    if PERISHABLE_MODIFIER_RE.search(name):
+        return "perishables"
+    if PANTRY_MODIFIER_RE.search(name):
+        return "pantry"
+    matches = KEYWORD_RE.findall(name)
+    if not matches:
+        return None
+    return _CATEGORY_BY_KEYWORD[max(reversed(matches), key=len)]
+
+def categorize_locally(ingredients):
+    """
+    Splits a list of {'item', 'quantity'} dicts into pantry items and perishables using the keyword tables.
+    Returns the categorized dict and the list of ingredients that could not be categorized.
+    """
+    categorized = {"pantry": [], "perishables": []}
+    unknown = []
+    for ingredient in ingredients:
+        category = categorize_ingredient(ingredient['item'])
+        if category:
+            categorized[category].append(ingredient)
+        else:
+            unknown.append(ingredient)
+    return categorized, unknown
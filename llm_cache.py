@@ -0,0 +1,63 @@
+# llm_cache.py
+
+import hashlib
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+import orjson
+
+# Bump this whenever a prompt template changes so stale responses are not reused
+PROMPT_VERSION = "v3"
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+CACHE_PATH = os.path.join(CACHE_DIR, "llm_cache.sqlite3")
+CACHE_TTL_SECONDS = 7 * 24 * 60 * 60 # Cached responses expire after 7 days
+
+def _connect():
+    """
+    Opens a connection to the cache database, creating it on first use.
+    A fresh connection is opened per call so the cache can be used from worker threads.
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    conn = sqlite3.connect(CACHE_PATH, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS llm_cache ("
+        "key TEXT PRIMARY KEY, value TEXT NOT NULL, expiresAt REAL NOT NULL)"
+    )
+    return conn
+
+def make_key(prompt, schema=None):
+    """
+    Builds a content-addressed cache key from the prompt, the response schema and PROMPT_VERSION.
+    """
+    raw = (PROMPT_VERSION + prompt).encode("utf-8") + orjson.dumps(schema, option=orjson.OPT_SORT_KEYS)
+    return hashlib.sha256(raw).hexdigest()
+
+def get(key):
+    """
+    Returns the cached value for `key`, or None if it is missing or expired.
+    """
+    try:
+        with closing(_connect()) as conn:
+            row = conn.execute(
+                "SELECT value FROM llm_cache WHERE key = ? AND expiresAt > ?", (key, time.time())
+            ).fetchone()
+    except sqlite3.Error:
+        return None # A broken cache should never break the app
+    return row[0] if row else None
+
+def set(key, value):
+    """
+    Stores `value` under `key` for CACHE_TTL_SECONDS.
+    """
+    try:
+        with closing(_connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expiresAt) VALUES (?, ?, ?)",
+                (key, value, time.time() + CACHE_TTL_SECONDS)
+            )
+    except sqlite3.Error:
+        pass
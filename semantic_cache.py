@@ -0,0 +1,105 @@
+# semantic_cache.py
+
+import os
+import threading
+import time
+
+import numpy as np
+import orjson
+
+from llm_cache import CACHE_TTL_SECONDS, PROMPT_VERSION
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "semantic_cache")
+DEFAULT_THRESHOLD = 0.92 # Minimum cosine similarity for two dish names to count as the same dish
+
+class SemanticCache:
+    """
+    Caches recipe results by the embedding of the dish name, so near-duplicate names
+    (e.g. "chicken tikka masala" vs "Chicken Tikka Masala for dinner") reuse an earlier result.
+    Embeddings are kept in one matrix so a lookup is a single vectorized cosine-similarity pass.
+    Entries only match when the servings are equal, since quantities depend on them.
+    Like the LLM response cache, entries expire after CACHE_TTL_SECONDS
+    and are ignored once PROMPT_VERSION changes.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, threshold=DEFAULT_THRESHOLD):
+        self.threshold = threshold
+        self._embeddings_path = os.path.join(cache_dir, "embeddings.npy")
+        self._entries_path = os.path.join(cache_dir, "entries.json")
+        self._lock = threading.Lock()
+        self._embeddings = None # np.ndarray of shape (N, dim)
+        self._norms = None
+        self._servings = None
+        self._expires_at = None
+        self._entries = [] # Parallel list of {"servings": ..., "value": ..., "prompt_version": ..., "expiresAt": ...}
+        self._load()
+
+    def _load(self):
+        try:
+            embeddings = np.load(self._embeddings_path)
+            with open(self._entries_path, "rb") as f:
+                entries = orjson.loads(f.read())
+        except (OSError, ValueError):
+            return # Start empty if the cache is missing or unreadable
+        if len(entries) != len(embeddings):
+            return
+        now = time.time()
+        keep = [
+            i for i, entry in enumerate(entries)
+            if entry.get("prompt_version") == PROMPT_VERSION and entry.get("expiresAt", 0) > now
+        ]
+        if keep:
+            self._set_state(embeddings[keep], [entries[i] for i in keep])
+
+    def _set_state(self, embeddings, entries):
+        self._embeddings = embeddings
+        self._norms = np.linalg.norm(embeddings, axis=1)
+        self._servings = np.array([entry["servings"] for entry in entries])
+        self._expires_at = np.array([entry["expiresAt"] for entry in entries])
+        self._entries = entries
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self._embeddings_path), exist_ok=True)
+            np.save(self._embeddings_path, self._embeddings)
+            with open(self._entries_path, "wb") as f:
+                f.write(orjson.dumps(self._entries))
+        except OSError:
+            pass # A cache that cannot be persisted still works for this session
+
+    def get(self, embedding, servings):
+        """
+        Returns the cached value whose embedding is most similar to `embedding`
+        (with the same servings), or None if no entry reaches the threshold.
+        """
+        query = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            if not self._entries or self._embeddings.shape[1] != query.shape[0]:
+                return None
+            denominator = self._norms * np.linalg.norm(query)
+            similarities = (self._embeddings @ query) / np.where(denominator == 0, 1, denominator)
+            similarities[(self._servings != servings) | (self._expires_at <= time.time())] = -1.0
+            best = int(similarities.argmax())
+            if similarities[best] < self.threshold:
+                return None
+            return self._entries[best]["value"]
+
+    def set(self, embedding, servings, value):
+        """
+        Adds a JSON-serializable `value` for the given dish embedding and servings, and persists the cache.
+        """
+        row = np.asarray(embedding, dtype=np.float32)[np.newaxis, :]
+        entry = {
+            "servings": servings,
+            "value": value,
+            "prompt_version": PROMPT_VERSION,
+            "expiresAt": time.time() + CACHE_TTL_SECONDS
+        }
+        with self._lock:
+            if self._entries and self._embeddings.shape[1] == row.shape[1]:
+                embeddings = np.vstack([self._embeddings, row])
+                entries = self._entries + [entry]
+            else:
+                embeddings, entries = row, [entry]
+            self._set_state(embeddings, entries)
+            self._save()